@@ -1,9 +1,16 @@
 # agent.py (refactored)
+import os
+import sys
+import time
+import atexit
+import queue
+import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
-from tool_processor import ToolProcessor
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from tool_processor import ToolProcessor, ToolCallScanner
 from prompt_manager import PromptManager
 from model_runner import ModelRunner
+from response_cache import CachedModelRunner
 from tools import AVAILABLE_TOOLS, SHELL_TOOL_SPEC, RUN_PYTHON_TOOL_SPEC
 from prompts import (
     TASK_COMPLETE_TAG,
@@ -13,154 +20,251 @@ from prompts import (
     FEEDBACK_AGENT_SYSTEM_PROMPT
 )
 
-# Configure logger
+# Configure logger. Records go through an in-memory queue and are written to
+# disk by a background listener thread, keeping file I/O (and its lock) off
+# the token-streaming path.
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 log_handler = RotatingFileHandler("agent_context.log", maxBytes=10*1024*1024, backupCount=5)
 formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 log_handler.setFormatter(formatter)
-logger.addHandler(log_handler)
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logger.addHandler(QueueHandler(_log_queue))
 logger.propagate = False
 
+# Longest per-message content echoed to the terminal; full content is in the log file
+MAX_DISPLAY_CHARS = 500
+
+class StreamPrinter:
+    """Batches streamed-token writes to stdout
+
+    print(token, flush=True) issues a syscall per token; at hundreds of
+    tokens per second the flushes become a measurable share of loop overhead.
+    Writes go straight to stdout's buffer and are flushed at most every
+    flush_every tokens or flush_interval seconds. Set NO_STREAM_PRINT=1 to
+    suppress token echoing entirely (e.g. for benchmarks).
+    """
+
+    def __init__(self, flush_every: int = 32, flush_interval: float = 0.05):
+        self.enabled = not os.getenv("NO_STREAM_PRINT")
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, token: str):
+        """Write a token, flushing only when the batch or time gate trips"""
+        if not self.enabled:
+            return
+        sys.stdout.write(token)
+        self._pending += 1
+        now = time.monotonic()
+        if self._pending >= self.flush_every or now - self._last_flush >= self.flush_interval:
+            sys.stdout.flush()
+            self._pending = 0
+            self._last_flush = now
+
+    def flush(self):
+        """Flush any buffered output, e.g. at the end of a generation"""
+        if self.enabled and self._pending:
+            sys.stdout.flush()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+
 class TaskAgent:
     """Main agent class coordinating task execution"""
-    
+
     def __init__(self, model: str = 'llama3.2:3b', max_iterations: int = 10):
         """Initialize the task agent"""
         self.tools = [SHELL_TOOL_SPEC, RUN_PYTHON_TOOL_SPEC]
         self.max_iterations = max_iterations
         self.tool_processor = ToolProcessor(AVAILABLE_TOOLS)
         self.prompt_manager = PromptManager(self.tools)
-        self.model_runner = ModelRunner(model)
-        self.feedback_runner = ModelRunner(model)
-    
+        self.model_runner = CachedModelRunner(ModelRunner(model))
+        self.feedback_runner = CachedModelRunner(ModelRunner(model))
+        self.stream_printer = StreamPrinter()
+        self._last_printed_idx = 0  # History position already echoed to the terminal
+
     def add_user_message(self, content: str):
         """Add initial user instruction"""
         self.prompt_manager.add_user_instruction(content)
-    
+
     def should_continue(self, content: str) -> bool:
         """Check if the task should continue"""
         return TASK_COMPLETE_TAG not in content.lower() and self.max_iterations > 0
-    
-    def get_feedback(self, context_messages):
+
+    async def get_feedback(self, context_messages):
         """Get feedback from the feedback agent with logging"""
         feedback_messages = [{
             'role': 'system',
             'content': FEEDBACK_AGENT_SYSTEM_PROMPT
         }]
         feedback_messages.extend(context_messages)
-        
-        full_response = ""
+
+        response_parts = []
         print("Feedback agent: ", end="", flush=True)
-        for token in self.feedback_runner.generate_tokens(feedback_messages):
-            full_response += token
-            print(token, end="", flush=True)
-        return full_response
-    
-    def print_context(self, messages, iteration):
-        """Print the current message context"""
+        async for token in self.feedback_runner.generate_tokens(feedback_messages):
+            response_parts.append(token)
+            self.stream_printer.write(token)
+        self.stream_printer.flush()
+        return ''.join(response_parts)
+
+    def print_context(self, iteration):
+        """Print the messages added since the last iteration
+
+        Re-printing the whole growing history every turn is O(N^2) terminal
+        I/O over a session, so only the delta is echoed, with long content
+        truncated; the full context is already in the log file.
+        """
+        history = self.prompt_manager.get_messages()
         print("-----------------------------")
-        for msg in messages:
-            print(f"{msg['role']}: {msg.get('content', '')}")
+        for msg in history[self._last_printed_idx:]:
+            content = msg.get('content', '')
+            if len(content) > MAX_DISPLAY_CHARS:
+                content = content[:MAX_DISPLAY_CHARS] + '...'
+            print(f"{msg['role']}: {content}")
+        self._last_printed_idx = len(history)
         print("-----------------------------")
         print(f"LLM Output (iteration #{iteration}): ", end="", flush=True)
 
-    def process_tool_call(self, tool_call, tool_call_text):
-        """Handle a processed tool call"""
-        logger.info("Tool processed with buffer: %s", tool_call_text)
+    async def process_tool_calls(self, tool_calls, tool_call_text):
+        """Handle a batch of executed tool calls
+
+        Outputs are appended in order of appearance, then a single feedback
+        pass covers the whole batch. The feedback generation needs the tool
+        outputs and the model slot is serialized per model, so there is no
+        useful work to overlap it with here.
+        """
+        logger.info("Tools processed with buffer: %s", tool_call_text)
         self.prompt_manager.append_assistant_content(tool_call_text)
         self.prompt_manager.complete_current_assistant()
-        self.prompt_manager.add_tool_output_as_user_message(tool_call.name, tool_call.output)
-        feedback = self.get_feedback(self.prompt_manager.get_messages())
+        for tool_call in tool_calls:
+            self.prompt_manager.add_tool_output_as_user_message(tool_call.name, tool_call.output)
         print("\n----------")
-        print(f"Command output: {tool_call.output}")
+        for tool_call in tool_calls:
+            print(f"Command output: {tool_call.output}")
         print("\n----------")
+        feedback = await self.get_feedback(self.prompt_manager.get_messages())
         self.prompt_manager.add_feedback_as_user_message(feedback)
         print()
 
-    def handle_generation_output(self, token_buffer, iteration):
-        """Process the model's output and handle tool calls"""
-        updated_buffer, tool_processed, tool_call = self.tool_processor.process_text(token_buffer)
-        if tool_processed and tool_call:
-            self.process_tool_call(tool_call, token_buffer)
-            return True, ""
-        return False, token_buffer
+    def handle_generation_output(self, scanner, token, buffer_parts, iteration):
+        """Feed a streamed token to the scanner and execute completed tool calls
 
-    def process_iteration(self, iteration):
+        The buffer is kept as a list of parts and only joined into a string
+        when a tool call actually completes, so no full-buffer string is
+        rebuilt per token.
+
+        Returns:
+            Tuple[list, str]: (executed tool calls, joined buffer). The list
+                is empty when nothing completed; the buffer is only
+                materialized when it is not.
+        """
+        detected = scanner.feed(token)
+        if not detected:
+            return [], ""
+        token_buffer = ''.join(buffer_parts)
+        # Ignore calls the model emitted after declaring the task complete
+        detected = [c for c in detected
+                    if TASK_COMPLETE_TAG not in token_buffer[:c.start_pos].lower()]
+        tool_calls = self.tool_processor.run_tool_calls(detected) if detected else []
+        return tool_calls, token_buffer
+
+    async def process_iteration(self, iteration):
         """Process a single iteration of the main loop"""
-        messages = self.prompt_manager.get_messages()
+        messages = self.prompt_manager.get_messages_windowed()
         logger.info("Messages before generation: %s", messages)
-        self.print_context(messages, iteration)
-        
-        token_buffer = ""
+        self.print_context(iteration)
+
+        buffer_parts = []
+        scanner = ToolCallScanner()  # Fresh scanner per generation
+        self.tool_processor.start_generation()  # Positions restart with the scanner
         try:
-            for token in self.model_runner.generate_tokens(messages):
-                token_buffer += token
-                print(token, end="", flush=True)
-                
-                tool_processed, token_buffer = self.handle_generation_output(token_buffer, iteration)
-                if tool_processed:
-                    return False  # Continue to next iteration after tool processing
-            
-            # Check remaining buffer after generation
-            tool_processed, token_buffer = self.handle_generation_output(token_buffer, iteration)
-            if not tool_processed and token_buffer:
-                self.prompt_manager.append_assistant_content(token_buffer)
-            
+            tool_calls = []
+            token_buffer = ""
+            stream = self.model_runner.generate_tokens(messages)
+            try:
+                async for token in stream:
+                    buffer_parts.append(token)
+                    self.stream_printer.write(token)
+
+                    tool_calls, token_buffer = self.handle_generation_output(scanner, token, buffer_parts, iteration)
+                    if tool_calls:
+                        break
+            finally:
+                # Release the shared model slot before the feedback agent
+                # (or the next iteration) needs it
+                await stream.aclose()
+            self.stream_printer.flush()
+
+            if tool_calls:
+                await self.process_tool_calls(tool_calls, token_buffer)
+                return False  # Continue to next iteration after tool processing
+
+            # The scanner has seen every token, so any remaining buffer holds
+            # no complete tool call; keep it as assistant content
+            if buffer_parts:
+                self.prompt_manager.append_assistant_content(''.join(buffer_parts))
+
             print()
             return self.check_completion()
 
         except Exception as e:
-            return self.handle_error(e)
+            return await self.handle_error(e)
 
     def check_completion(self):
         """Check if the task is complete and return the result if so"""
-        messages = self.prompt_manager.get_messages()
-        assistant_msgs = [m for m in messages if m['role'] == 'assistant']
-        logger.info("Messages after generation: %s", messages)
-        
-        if assistant_msgs and not self.should_continue(assistant_msgs[-1]['content']):
-            content = assistant_msgs[-1]['content'].lower()
-            task_complete_idx = content.find(TASK_COMPLETE_TAG)
-            result = (assistant_msgs[-1]['content'][task_complete_idx + len(TASK_COMPLETE_TAG):].strip() 
+        logger.info("Messages after generation: %s", self.prompt_manager.get_messages())
+
+        last_content = self.prompt_manager.get_last_assistant_content()
+        if last_content is not None and not self.should_continue(last_content):
+            task_complete_idx = last_content.lower().find(TASK_COMPLETE_TAG)
+            result = (last_content[task_complete_idx + len(TASK_COMPLETE_TAG):].strip()
                      or TASK_COMPLETE_DEFAULT_RESULT)
             logger.info("Task complete with result: %s", result)
             return result
         return None
 
-    def handle_error(self, error):
+    async def handle_error(self, error):
         """Handle execution errors"""
         logger.error("Error during execution: %s", str(error))
         error_msg = f"\nError during execution: {str(error)}"
         self.prompt_manager.append_assistant_content(error_msg)
         self.prompt_manager.complete_current_assistant()
-        feedback = self.get_feedback(self.prompt_manager.get_messages())
+        feedback = await self.get_feedback(self.prompt_manager.get_messages())
         print("\n----------")
         print(f"Command output: {error_msg}")
         print("\n----------")
         self.prompt_manager.add_feedback_as_user_message(feedback)
         return self.prompt_manager.get_messages()[-1]['content']
 
-    def run(self) -> str:
+    async def run_async(self) -> str:
         """Execute the task with streaming and tool processing"""
         logger.info('Initial prompt: %s', self.prompt_manager.get_messages()[1]['content'])
         iteration = 0
-        
+
         while iteration < self.max_iterations:
             iteration += 1
             logger.info('Iteration %d:', iteration)
-            
-            result = self.process_iteration(iteration)
+
+            result = await self.process_iteration(iteration)
             if result is not None:
                 return result
-        
+
         logger.info("Maximum iterations reached")
         print("Maximum iterations reached")
         self.prompt_manager.append_assistant_content(MAX_ITERATIONS_MESSAGE)
         self.prompt_manager.complete_current_assistant()
         return self.prompt_manager.get_messages()[-1]['content']
 
+    def run(self) -> str:
+        """Synchronous entry point wrapping the async event loop"""
+        return asyncio.run(self.run_async())
+
 if __name__ == "__main__":
     agent = TaskAgent(model="gemma3:27b", max_iterations=25)
     agent.add_user_message(EXAMPLE_USER_MESSAGE)
-    result = agent.run()
\ No newline at end of file
+    result = agent.run()
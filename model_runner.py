@@ -1,68 +1,166 @@
-from ollama import chat
+import uuid
+import asyncio
 import logging
-from typing import Generator, List, Dict, Any
+from ollama import AsyncClient
+from typing import AsyncGenerator, List, Dict, Any, Optional
+
+# How long Ollama should keep the model (and its kv_cache) resident between
+# requests. Reusing the same loaded model lets llama.cpp's prefix-match cache
+# skip re-evaluating the unchanged message prefix on every iteration.
+KEEP_ALIVE = "1h"
+
+# One process-wide client so every runner (main agent, feedback agent) reuses
+# the same keep-alive connection pool to Ollama instead of opening a fresh
+# TCP connection per request. Created lazily so importing this module stays
+# side-effect free.
+_shared_client: Optional[AsyncClient] = None
+
+def get_shared_client() -> AsyncClient:
+    """Get the process-wide Ollama client, creating it on first use
+
+    Returns:
+        AsyncClient: The shared client with persistent keep-alive connections
+    """
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = AsyncClient()
+    return _shared_client
+
+class SharedModelPool:
+    """One loaded-model slot shared by every runner using the same model
+
+    The main and feedback agents used to hold separate logical sessions for
+    the same weights, causing slot churn between turns. A pool owns the
+    shared client and an asyncio.Lock serializing generations per model, so
+    requests from different runners take turns on one keep_alive slot instead
+    of thrashing it. Generators must release the lock when closed, which the
+    agent guarantees by aclosing abandoned streams.
+    """
+
+    _pools: Dict[str, "SharedModelPool"] = {}
+
+    def __init__(self, model: str):
+        self.model = model
+        self.client = get_shared_client()
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    def for_model(cls, model: str) -> "SharedModelPool":
+        """Get (or create) the pool for a model name
+
+        Args:
+            model (str): Model identifier
+
+        Returns:
+            SharedModelPool: The process-wide pool for that model
+        """
+        pool = cls._pools.get(model)
+        if pool is None:
+            pool = cls._pools[model] = cls(model)
+        return pool
 
 class ModelRunner:
-    """Handles model interaction and token generation using chat interface"""
-    
-    def __init__(self, model: str = 'llama3.2:3b'):
+    """Stateless per-conversation view over a shared model slot
+
+    Conversation history is owned by the caller (PromptManager); the runner
+    only remembers which messages it last sent, for prompt-cache diagnostics.
+    The client, slot and serialization live in the SharedModelPool.
+    """
+
+    def __init__(self, model: str = 'llama3.2:3b', client: Optional[AsyncClient] = None):
         """Initialize model runner
-        
+
         Args:
             model (str): Model identifier
+            client (AsyncClient, optional): Client to issue requests through.
+                Defaults to the process-wide shared client.
         """
         self.model = model
         self.logger = logging.getLogger(__name__)
-        self.messages: List[Dict[str, str]] = []
-    
-    def generate_tokens(self, messages: List[Dict[str, str]]) -> Generator[str, None, None]:
+        self.pool = SharedModelPool.for_model(model)
+        self.client = client if client is not None else self.pool.client
+        # Snapshot of the last request's (role, content) pairs, used only to
+        # estimate how much of the next prompt the server-side prefix cache
+        # can reuse. A snapshot, not a reference: the caller mutates its
+        # message list in place between calls.
+        self._last_sent: List[tuple] = []
+        self.session_id = uuid.uuid4().hex
+
+    def _prefix_length(self, messages: List[Dict[str, str]]) -> int:
+        """Count how many leading messages are byte-identical to the last request
+
+        The prompt prefix only stays cached server-side if the new request
+        starts with exactly the same messages as the previous one, so this is
+        effectively the number of messages whose prefill we expect to skip.
+
+        Args:
+            messages (List[Dict[str, str]]): Messages about to be sent
+
+        Returns:
+            int: Length of the shared message prefix
+        """
+        shared = 0
+        for (old_role, old_content), new in zip(self._last_sent, messages):
+            if old_role != new.get('role') or old_content != new.get('content'):
+                break
+            shared += 1
+        return shared
+
+    async def generate_tokens(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
         """Generate tokens from the model using chat interface
-        
+
+        Sends the full message list but asks Ollama to cache the prompt and
+        keep the model loaded, so only the suffix that changed since the last
+        call is actually prefilled.
+
         Args:
             messages (List[Dict[str, str]]): List of message dictionaries with 'role' and 'content'
-            
+
         Yields:
             str: Individual tokens
         """
         try:
-            # Update the message history with new messages
-            self.messages = messages.copy()
-            
-            # Make chat request with streaming
-            response = chat(
-                model=self.model,
-                messages=self.messages,
-                stream=True,
-                # options={
-                #     "num_ctx": 40_000
-                # }
-            )
-            
-            # Collect full response for history
-            full_response = ""
-            for part in response:
-                token = part['message']['content']
-                full_response += token
-                yield token
-            
-            # Add assistant response to history
-            self.messages.append({
-                'role': 'assistant',
-                'content': full_response
-            })
-            
+            prefix_len = self._prefix_length(messages)
+            if self._last_sent and prefix_len < len(self._last_sent):
+                self.logger.warning(
+                    "Session %s: message prefix changed at index %d; kv_cache reuse will be partial",
+                    self.session_id, prefix_len
+                )
+            else:
+                self.logger.debug(
+                    "Session %s: %d of %d messages reusable from prompt cache",
+                    self.session_id, prefix_len, len(messages)
+                )
+
+            self._last_sent = [(m.get('role', ''), m.get('content', '')) for m in messages]
+
+            # Serialize generations on the shared slot; the lock is released
+            # when the stream completes or the generator is closed
+            async with self.pool.lock:
+                # Make chat request with streaming; cache_prompt lets
+                # llama.cpp reuse its kv_cache for the unchanged prefix
+                # instead of re-evaluating the whole context each turn.
+                response = await self.client.chat(
+                    model=self.model,
+                    messages=messages,
+                    stream=True,
+                    keep_alive=KEEP_ALIVE,
+                    options={
+                        "cache_prompt": True,
+                        # "num_ctx": 40_000
+                    }
+                )
+
+                # The caller (PromptManager) keeps the transcript, so no
+                # duplicate response accumulation happens here
+                async for part in response:
+                    yield part['message']['content']
+
         except Exception as e:
             self.logger.error("Generation error: %s", str(e))
             raise
-    
-    def get_history(self) -> List[Dict[str, str]]:
-        """Get the current message history
-        
-        Returns:
-            List[Dict[str, str]]: List of message dictionaries
-        """
-        return self.messages
-    
+
     def clear_history(self) -> None:
-        """Clear the message history"""
-        self.messages = []
\ No newline at end of file
+        """Forget the last-sent messages and start a fresh cache session"""
+        self._last_sent = []
+        self.session_id = uuid.uuid4().hex
@@ -1,13 +1,20 @@
 # prompt_manager.py (updated)
-from typing import List, Dict, Any
-import json
+from typing import List, Dict, Any, Optional
 from prompts import (
-    SYSTEM_PROMPT_TOOLS_INTRO,
-    SYSTEM_PROMPT_FORMATTING,
+    SYSTEM_PROMPT,
+    DEFAULT_TOOL_SPECS,
+    build_system_prompt,
     SIMULATED_USER_CONTINUATION,  # Keep for reference but won't be used
     TOOL_OUTPUT_PREFIX
 )
 
+# Default prompt budget for windowed contexts, in (approximate) tokens
+DEFAULT_WINDOW_TOKENS = 8000
+# Tokens reserved for the summary message when the window is applied
+SUMMARY_RESERVE_TOKENS = 512
+# How many characters of each summarized message survive in the digest
+SUMMARY_SNIPPET_CHARS = 160
+
 class PromptManager:
     """Manages prompt formatting and context accumulation using message dictionaries"""
     
@@ -15,16 +22,22 @@ class PromptManager:
         """Initialize prompt manager"""
         self.tools = tools
         self.context_tail_length = context_tail_length
+        # The default tool set reuses the prompt frozen at import so the
+        # system message is byte-identical across agents and process restarts
+        system_prompt = (SYSTEM_PROMPT if tools == DEFAULT_TOOL_SPECS
+                         else build_system_prompt(tools))
         self.messages: List[Dict[str, str]] = [
             {
                 'role': 'system',
-                'content': f"""{SYSTEM_PROMPT_TOOLS_INTRO}
-{json.dumps(self.tools, indent=2)}
-
-{SYSTEM_PROMPT_FORMATTING}"""
+                'content': system_prompt
             }
         ]
-    
+        # Index of the most recent assistant message; messages are append-only
+        # so this avoids rescanning the whole list on every hot-path lookup
+        self._last_assistant_idx: Optional[int] = None
+        # Cached summary of dropped history, keyed by how many messages it covers
+        self._summary_cache: Optional[tuple] = None
+
     def add_user_instruction(self, content: str):
         """Add initial user instruction"""
         self.messages.append({
@@ -34,21 +47,22 @@ class PromptManager:
     
     def append_assistant_content(self, content: str):
         """Append content to the current assistant message"""
-        assistant_msgs = [m for m in self.messages if m['role'] == 'assistant']
-        if assistant_msgs and not assistant_msgs[-1].get('completed', False):
-            assistant_msgs[-1]['content'] += content
-        else:
-            self.messages.append({
-                'role': 'assistant',
-                'content': content,
-                'completed': False
-            })
-    
+        if self._last_assistant_idx is not None:
+            last = self.messages[self._last_assistant_idx]
+            if not last.get('completed', False):
+                last['content'] += content
+                return
+        self.messages.append({
+            'role': 'assistant',
+            'content': content,
+            'completed': False
+        })
+        self._last_assistant_idx = len(self.messages) - 1
+
     def complete_current_assistant(self):
         """Mark the current assistant message as complete"""
-        assistant_msgs = [m for m in self.messages if m['role'] == 'assistant']
-        if assistant_msgs and not assistant_msgs[-1].get('completed', False):
-            assistant_msgs[-1]['completed'] = True
+        if self._last_assistant_idx is not None:
+            self.messages[self._last_assistant_idx]['completed'] = True
     
     def add_tool_output_as_user_message(self, tool_name: str, output: str):
         """Add tool output as a new user message"""
@@ -64,16 +78,108 @@ class PromptManager:
             'content': feedback
         })
     
+    def get_last_assistant_content(self) -> Optional[str]:
+        """Get the content of the most recent assistant message, if any"""
+        if self._last_assistant_idx is None:
+            return None
+        return self.messages[self._last_assistant_idx]['content']
+
     def get_context_tail(self) -> str:
         """Get the last portion of the most recent assistant content"""
-        assistant_msgs = [m for m in self.messages if m['role'] == 'assistant']
-        if not assistant_msgs:
+        content = self.get_last_assistant_content()
+        if content is None:
             return ""
-        content = assistant_msgs[-1]['content']
-        return (content[-self.context_tail_length:] 
-                if len(content) > self.context_tail_length 
+        return (content[-self.context_tail_length:]
+                if len(content) > self.context_tail_length
                 else content)
-    
+
+    @staticmethod
+    def _estimate_tokens(text: str) -> int:
+        """Approximate the token count of a string (fast chars/4 heuristic)"""
+        return len(text) // 4 + 1
+
+    def _summarize(self, messages: List[Dict[str, str]]) -> str:
+        """Build a compact digest of messages dropped from the window
+
+        A deterministic one-line-per-message digest rather than an LLM
+        summary: it costs nothing, never blocks on the model slot, and its
+        bytes are stable so the windowed prefix stays cacheable. The digest
+        itself is capped at SUMMARY_RESERVE_TOKENS — only the most recent
+        dropped messages keep a line, older ones roll up into a count — so
+        the window stays bounded no matter how long the session runs.
+        """
+        header = "Summary of earlier conversation (older messages elided to fit the context window):"
+        lines = []
+        for msg in messages:
+            content = msg.get('content', '')
+            snippet = ' '.join(content[:SUMMARY_SNIPPET_CHARS].split())
+            suffix = '...' if len(content) > SUMMARY_SNIPPET_CHARS else ''
+            lines.append(f"- {msg['role']}: {snippet}{suffix}")
+
+        # Keep only the most recent lines that fit the reserved budget
+        budget = SUMMARY_RESERVE_TOKENS - self._estimate_tokens(header)
+        kept: List[str] = []
+        used = 0
+        for line in reversed(lines):
+            cost = self._estimate_tokens(line)
+            if used + cost > budget:
+                break
+            kept.append(line)
+            used += cost
+        kept.reverse()
+
+        omitted = len(lines) - len(kept)
+        out = [header]
+        if omitted:
+            out.append(f"- ({omitted} older messages omitted)")
+        out.extend(kept)
+        return '\n'.join(out)
+
+    def get_messages_windowed(self, max_tokens: int = DEFAULT_WINDOW_TOKENS) -> List[Dict[str, str]]:
+        """Get the message array bounded to an approximate token budget
+
+        Returns the full history while it fits. Once it outgrows the budget,
+        the result is [system] + [summary of dropped middle] + recent tail, so
+        per-turn prefill stays O(window) instead of O(iteration). The summary
+        is cached per boundary, so repeated calls between mutations are cheap.
+
+        Args:
+            max_tokens (int): Approximate token budget for the whole prompt
+
+        Returns:
+            List[Dict[str, str]]: Messages to send to the model
+        """
+        total = sum(self._estimate_tokens(m.get('content', '')) for m in self.messages)
+        if total <= max_tokens:
+            return self.messages
+
+        system = self.messages[0]
+        budget = (max_tokens
+                  - self._estimate_tokens(system.get('content', ''))
+                  - SUMMARY_RESERVE_TOKENS)
+
+        # The newest message is what the model must respond to, so it is kept
+        # unconditionally even when it alone exceeds the budget; older
+        # messages then fill whatever budget remains
+        tail_start = len(self.messages) - 1
+        used = self._estimate_tokens(self.messages[-1].get('content', ''))
+        while tail_start > 1:
+            cost = self._estimate_tokens(self.messages[tail_start - 1].get('content', ''))
+            if used + cost > budget:
+                break
+            used += cost
+            tail_start -= 1
+
+        dropped = self.messages[1:tail_start]
+        if not dropped:
+            return self.messages
+
+        if self._summary_cache is None or self._summary_cache[0] != tail_start:
+            self._summary_cache = (tail_start, self._summarize(dropped))
+        summary_msg = {'role': 'user', 'content': self._summary_cache[1]}
+
+        return [system, summary_msg] + self.messages[tail_start:]
+
     def get_messages(self) -> List[Dict[str, str]]:
         """Get the current message array"""
         return self.messages
\ No newline at end of file
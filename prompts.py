@@ -1,5 +1,9 @@
 # prompts.py
 """Centralized prompt strings for the agent system"""
+import json
+from typing import Any, Dict, List
+
+from tools import SHELL_TOOL_SPEC, RUN_PYTHON_TOOL_SPEC
 
 # System prompt components from prompt_manager.py
 SYSTEM_PROMPT_TOOLS_INTRO = "Available tools:"
@@ -25,6 +29,29 @@ logging.debug('Hello, world!')
 - NEVER use placeholders in your code. No one will replace them.
 - If you run into an error when running a command, NEVER STOP TRYING. Don't exit until the job is done. <3"""
 
+def build_system_prompt(tools: List[Dict[str, Any]]) -> str:
+    """Assemble the system prompt for a set of tool specifications
+
+    The tool JSON is serialized compactly with sorted keys so the resulting
+    bytes are deterministic across runs — a prerequisite for Ollama's
+    prefix-match prompt cache to hit on the system prompt every time.
+
+    Args:
+        tools (List[Dict[str, Any]]): Tool specifications to advertise
+
+    Returns:
+        str: The complete system prompt
+    """
+    tools_json = json.dumps(tools, separators=(',', ':'), sort_keys=True)
+    return f"""{SYSTEM_PROMPT_TOOLS_INTRO}
+{tools_json}
+
+{SYSTEM_PROMPT_FORMATTING}"""
+
+# Default tool set and its frozen system prompt, serialized once at import
+DEFAULT_TOOL_SPECS = [SHELL_TOOL_SPEC, RUN_PYTHON_TOOL_SPEC]
+SYSTEM_PROMPT = build_system_prompt(DEFAULT_TOOL_SPECS)
+
 # TaskAgent messages
 TASK_COMPLETE_TAG = '[task_complete]'
 TASK_COMPLETE_DEFAULT_RESULT = "Task completed successfully"
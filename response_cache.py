@@ -0,0 +1,159 @@
+import json
+import math
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import AsyncGenerator, Dict, List, Optional
+
+from model_runner import ModelRunner
+
+# Local model used to embed prompts for the semantic tier
+EMBEDDING_MODEL = 'nomic-embed-text'
+# Minimum cosine similarity between last-user-message embeddings to treat a
+# prior response as reusable
+SIMILARITY_THRESHOLD = 0.95
+# Bound on cached responses; least recently used entries are evicted first
+MAX_CACHE_ENTRIES = 128
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """Compute cosine similarity between two embedding vectors
+
+    Args:
+        a (List[float]): First vector
+        b (List[float]): Second vector
+
+    Returns:
+        float: Similarity in [-1, 1], or 0.0 for degenerate vectors
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    norm_a = math.sqrt(sum(x * x for x in a))
+    norm_b = math.sqrt(sum(x * x for x in b))
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / (norm_a * norm_b)
+
+class CachedModelRunner:
+    """Two-tier response cache wrapped around a ModelRunner
+
+    Exact tier: SHA-256 of (model, canonical message JSON) keys a stored token
+    list, so temperature-0 repeats of an identical context never reach the
+    model. Semantic tier: the last user message is embedded locally and a
+    cosine-similarity hit above the threshold replays the matching prior
+    response. On a hit the cached tokens are yielded as a fake stream so
+    callers are oblivious; on a miss the wrapped runner streams normally and
+    the response is recorded on the way through.
+    """
+
+    def __init__(self, runner: ModelRunner,
+                 similarity_threshold: float = SIMILARITY_THRESHOLD,
+                 max_entries: int = MAX_CACHE_ENTRIES):
+        """Initialize the cache around an existing runner
+
+        Args:
+            runner (ModelRunner): The runner performing real generations
+            similarity_threshold (float): Cosine similarity needed for a
+                semantic hit
+            max_entries (int): Maximum cached responses before LRU eviction
+        """
+        self.runner = runner
+        self.model = runner.model
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.logger = logging.getLogger(__name__)
+        # key -> token list, in LRU order
+        self._responses: "OrderedDict[str, List[str]]" = OrderedDict()
+        # key -> embedding of the last user message for that entry
+        self._embeddings: Dict[str, List[float]] = {}
+
+    def _exact_key(self, messages: List[Dict[str, str]]) -> str:
+        """Build the exact-tier key from the model and canonical message JSON"""
+        canonical = json.dumps(
+            [{'role': m.get('role', ''), 'content': m.get('content', '')} for m in messages],
+            sort_keys=True, separators=(',', ':')
+        )
+        return hashlib.sha256(f"{self.model}:{canonical}".encode()).hexdigest()
+
+    @staticmethod
+    def _last_user_content(messages: List[Dict[str, str]]) -> Optional[str]:
+        """Get the content of the most recent user message, if any"""
+        for msg in reversed(messages):
+            if msg.get('role') == 'user':
+                return msg.get('content', '')
+        return None
+
+    async def _embed(self, text: str) -> Optional[List[float]]:
+        """Embed text locally, returning None if the embedding model is unavailable"""
+        try:
+            response = await self.runner.client.embeddings(model=EMBEDDING_MODEL, prompt=text)
+            return list(response['embedding'])
+        except Exception as e:
+            self.logger.debug("Embedding unavailable, semantic tier skipped: %s", str(e))
+            return None
+
+    def _semantic_lookup(self, embedding: List[float]) -> Optional[str]:
+        """Find the cached entry whose prompt embedding is closest above threshold"""
+        best_key = None
+        best_score = self.similarity_threshold
+        for key, cached_embedding in self._embeddings.items():
+            score = cosine_similarity(embedding, cached_embedding)
+            if score >= best_score:
+                best_score = score
+                best_key = key
+        return best_key
+
+    def _store(self, key: str, tokens: List[str], embedding: Optional[List[float]]):
+        """Record a response in both tiers, evicting the LRU entry if full"""
+        self._responses[key] = tokens
+        self._responses.move_to_end(key)
+        if embedding is not None:
+            self._embeddings[key] = embedding
+        while len(self._responses) > self.max_entries:
+            evicted_key, _ = self._responses.popitem(last=False)
+            self._embeddings.pop(evicted_key, None)
+
+    async def generate_tokens(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+        """Generate tokens, replaying a cached response when one applies
+
+        Args:
+            messages (List[Dict[str, str]]): List of message dictionaries with 'role' and 'content'
+
+        Yields:
+            str: Individual tokens, cached or freshly generated
+        """
+        key = self._exact_key(messages)
+        cached = self._responses.get(key)
+        if cached is not None:
+            self.logger.info("Exact cache hit, replaying %d tokens", len(cached))
+            self._responses.move_to_end(key)
+            for token in cached:
+                yield token
+            return
+
+        embedding = None
+        last_user = self._last_user_content(messages)
+        if last_user:
+            embedding = await self._embed(last_user)
+            if embedding is not None:
+                semantic_key = self._semantic_lookup(embedding)
+                if semantic_key is not None:
+                    cached = self._responses[semantic_key]
+                    self.logger.info("Semantic cache hit, replaying %d tokens", len(cached))
+                    self._responses.move_to_end(semantic_key)
+                    for token in cached:
+                        yield token
+                    return
+
+        tokens: List[str] = []
+        stream = self.runner.generate_tokens(messages)
+        try:
+            async for token in stream:
+                tokens.append(token)
+                yield token
+        finally:
+            # Release the underlying slot even when this stream is abandoned
+            await stream.aclose()
+        self._store(key, tokens, embedding)
+
+    def clear_history(self) -> None:
+        """Reset the wrapped runner's cache session"""
+        self.runner.clear_history()
@@ -1,62 +1,251 @@
 import re
+import os
 import json
 import time
 import logging
-from typing import Optional, Tuple, Dict, Any, List
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Optional, Dict, Any, List, Set, Callable
+from dataclasses import dataclass, replace
+from prompts import TASK_COMPLETE_TAG
 
-@dataclass
+# Pattern for multi-line tool calls, compiled once at import:
+# [tool_name]|||content|||
+_TOOL_RE = re.compile(r'\[(\w+)\]\|\|\|(.*?)\|\|\|', re.DOTALL)
+
+# Character limit on tool output shown to the model
+_OUTPUT_LIMIT = 1000
+
+def _wrap(out: str) -> str:
+    """Wrap tool output in <<< >>> delimiters, truncated to the display limit
+
+    Slicing handles short strings in O(1), so no length check is needed.
+    """
+    return f"<<< {out[:_OUTPUT_LIMIT]} >>>"
+
+@dataclass(slots=True, frozen=True)
 class ToolCall:
-    """Represents a single tool call with its metadata"""
-    id: str
+    """Represents a single tool call with its metadata
+
+    Slots halve per-instance memory and frozen makes instances hashable, so
+    calls constructed in the hot scanning loop stay cheap and dedupable.
+    Executed copies carry their output via dataclasses.replace.
+    """
     name: str
     content: str  # Changed from args_str to content for multi-line support
     start_pos: int
-    end_pos: int
     output: Optional[str] = None
-    executed: bool = False
+
+# ToolCallScanner states
+_TEXT = 0
+_IN_NAME = 1
+_EXPECT_BAR1 = 2
+_EXPECT_BAR2 = 3
+_EXPECT_BAR3 = 4
+_IN_CONTENT = 5
+_CLOSE_BAR1 = 6
+_CLOSE_BAR2 = 7
+
+class ToolCallScanner:
+    """Incremental recognizer for [tool_name]|||content||| calls
+
+    A small state machine fed one streamed token at a time. Each character is
+    examined exactly once, so detection cost is O(len(token)) per feed instead
+    of a regex pass over the whole accumulated buffer. Create a fresh scanner
+    per generation; positions are relative to the stream fed so far.
+    """
+
+    def __init__(self):
+        self.state = _TEXT
+        self.pos = 0  # Absolute position of the next character
+        self.start_pos = 0  # Where the candidate call started
+        self.name_chars: List[str] = []
+        self.content_chars: List[str] = []
+
+    def _fail(self, ch: str):
+        """Abandon the current candidate and re-examine ch as plain text"""
+        self.state = _TEXT
+        if ch == '[':
+            self.state = _IN_NAME
+            self.start_pos = self.pos
+            self.name_chars = []
+
+    def feed(self, token: str) -> List[ToolCall]:
+        """Consume a streamed token and return any tool calls it completed
+
+        Args:
+            token (str): The next chunk of generated text
+
+        Returns:
+            List[ToolCall]: Complete (unexecuted) tool calls ending in this
+                token, usually empty or a single call
+        """
+        completed = []
+        for ch in token:
+            if self.state == _TEXT:
+                if ch == '[':
+                    self.state = _IN_NAME
+                    self.start_pos = self.pos
+                    self.name_chars = []
+            elif self.state == _IN_NAME:
+                if ch == ']' and self.name_chars:
+                    self.state = _EXPECT_BAR1
+                elif ch.isalnum() or ch == '_':
+                    self.name_chars.append(ch)
+                else:
+                    self._fail(ch)
+            elif self.state == _EXPECT_BAR1:
+                if ch == '|':
+                    self.state = _EXPECT_BAR2
+                else:
+                    self._fail(ch)
+            elif self.state == _EXPECT_BAR2:
+                if ch == '|':
+                    self.state = _EXPECT_BAR3
+                else:
+                    self._fail(ch)
+            elif self.state == _EXPECT_BAR3:
+                if ch == '|':
+                    self.state = _IN_CONTENT
+                    self.content_chars = []
+                else:
+                    self._fail(ch)
+            elif self.state == _IN_CONTENT:
+                if ch == '|':
+                    self.state = _CLOSE_BAR1
+                else:
+                    self.content_chars.append(ch)
+            elif self.state == _CLOSE_BAR1:
+                if ch == '|':
+                    self.state = _CLOSE_BAR2
+                else:
+                    self.content_chars.append('|')
+                    self.content_chars.append(ch)
+                    self.state = _IN_CONTENT
+            elif self.state == _CLOSE_BAR2:
+                if ch == '|':
+                    completed.append(ToolCall(
+                        name=''.join(self.name_chars),
+                        content=''.join(self.content_chars).strip(),
+                        start_pos=self.start_pos
+                    ))
+                    self.state = _TEXT
+                else:
+                    self.content_chars.append('||')
+                    self.content_chars.append(ch)
+                    self.state = _IN_CONTENT
+            self.pos += 1
+        return completed
+
+class ParallelToolExecutor:
+    """Runs independent tool calls concurrently in a per-processor thread pool"""
+
+    def __init__(self, max_workers: int = None):
+        """Initialize the executor
+
+        Args:
+            max_workers (int, optional): Pool size. Defaults to the
+                TOOL_CONCURRENCY_LIMIT environment variable, or 1.
+        """
+        if max_workers is None:
+            max_workers = int(os.getenv("TOOL_CONCURRENCY_LIMIT", 1))
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def execute_all(self, tool_calls: List[ToolCall],
+                    execute_fn: Callable[[ToolCall], str]) -> List[ToolCall]:
+        """Execute all tool calls concurrently and return executed copies
+
+        Results keep the input order regardless of completion order, so
+        shell/subprocess latencies overlap instead of summing. ToolCall is
+        frozen, so each result is a copy carrying its output.
+
+        Args:
+            tool_calls (List[ToolCall]): Independent tool calls to run
+            execute_fn (Callable[[ToolCall], str]): Function executing a single call
+
+        Returns:
+            List[ToolCall]: Executed copies with outputs attached, in input order
+        """
+        futures = [(self.pool.submit(execute_fn, call), call) for call in tool_calls]
+        wait([future for future, _ in futures])
+        return [replace(call, output=future.result()) for future, call in futures]
 
 class ToolProcessor:
     """Handles detection and execution of tool calls in text content"""
-    
+
     def __init__(self, available_functions: Dict[str, callable]):
         """Initialize with available functions
-        
+
         Args:
             available_functions (Dict[str, callable]): Dictionary of tool name to function
         """
         self.available_functions = available_functions
-        # Updated pattern for multi-line tool calls: [tool_name]|||content|||
-        self.tool_pattern = r'\[(\w+)\]\|\|\|(.*?)\|\|\|'
         self.logger = logging.getLogger(__name__)
-        self.executed_tools: Dict[str, ToolCall] = {}  # Track tool calls by ID
+        # Positions already processed; membership is the only hot query, so a
+        # plain int set beats a dict of call objects keyed by formatted ids
+        self._executed_positions: Set[int] = set()
+        self._executed_outputs: Dict[int, str] = {}  # start_pos -> output, filled on completion
+        self.executor = ParallelToolExecutor()  # Per-agent pool, avoids cross-agent deadlock
+        self._scan_offset = 0  # Buffer position below which no new match can start
+
+    def start_generation(self) -> None:
+        """Reset per-generation scan state
+
+        Positions restart at 0 with every generation's fresh buffer and
+        scanner, so tracking carried across generations would falsely skip a
+        later call that happens to start at the same offset as an earlier
+        one. Call this wherever a new generation (and its scanner) begins.
+        """
+        self._executed_positions.clear()
+        self._executed_outputs.clear()
+        self._scan_offset = 0
     
     def find_unexecuted_tool_calls(self, text: str) -> List[ToolCall]:
         """Find all tool calls that haven't been executed yet
-        
+
+        Called once per streamed token, so scanning restarts from
+        _scan_offset rather than position 0 — regions that can no longer
+        contain the start of a new match are never rescanned, keeping the
+        per-token cost proportional to the new tail instead of the whole
+        buffer.
+
         Args:
             text (str): Text to search for tool calls
-            
+
         Returns:
             List[ToolCall]: List of unexecuted tool calls
         """
+        if self._scan_offset > len(text):
+            # Buffer was replaced with a shorter one; start over
+            self._scan_offset = 0
+
         tool_calls = []
-        for match in re.finditer(self.tool_pattern, text, re.DOTALL):
+        last_end = None
+        for match in _TOOL_RE.finditer(text, self._scan_offset):
+            last_end = match.end()
             tool_name = match.group(1)
             content = match.group(2).strip()
             start_pos = match.start()
-            tool_id = f"tool_{start_pos}"  # Unique ID based on position
-            
-            if tool_id not in self.executed_tools:
-                self.logger.info('Found new tool call: %s at position %d', match.group(), start_pos)
+
+            if start_pos not in self._executed_positions:
+                if self.logger.isEnabledFor(logging.INFO):
+                    self.logger.info('Found new tool call: %s at position %d', match.group(), start_pos)
                 tool_calls.append(ToolCall(
-                    id=tool_id,
                     name=tool_name,
                     content=content,
-                    start_pos=start_pos,
-                    end_pos=match.end()
+                    start_pos=start_pos
                 ))
-        
+
+        if last_end is not None:
+            # Everything up to the end of the last complete match is settled
+            self._scan_offset = last_end
+        else:
+            # No complete match in the tail; a future match can only start at
+            # a '[' we have already seen (or in text not yet received). Resume
+            # from the earliest such bracket — a later one may sit inside the
+            # content of a still-pending call.
+            bracket = text.find('[', self._scan_offset)
+            self._scan_offset = len(text) if bracket == -1 else bracket
+
         return tool_calls
     
     def execute_tool(self, tool_call: ToolCall) -> str:
@@ -70,11 +259,19 @@ class ToolProcessor:
         """
         if function_to_call := self.available_functions.get(tool_call.name):
             try:
-                # Try to parse content as JSON first (for backward compatibility)
-                try:
-                    args = json.loads(tool_call.content)
-                except json.JSONDecodeError:
-                    # If not JSON, treat as plain string appropriate to the tool
+                # Content is plain text in the documented format; only attempt
+                # a JSON parse (kept for backward compatibility) when it can
+                # actually be a JSON object — raising and catching
+                # JSONDecodeError on every call is far slower than this check
+                args = None
+                stripped = tool_call.content.lstrip()
+                if stripped[:1] == '{':
+                    try:
+                        args = json.loads(stripped)
+                    except json.JSONDecodeError:
+                        args = None
+                if not isinstance(args, dict):
+                    # Plain string appropriate to the tool (the common case)
                     if tool_call.name == 'shell':
                         args = {'command': tool_call.content}
                     elif tool_call.name == 'run_python':
@@ -82,50 +279,69 @@ class ToolProcessor:
                     else:
                         raise ValueError("Content must be valid JSON for this tool")
                 
-                self.logger.info('Calling function: %s with ID: %s', tool_call.name, tool_call.id)
+                self.logger.info('Calling function: %s at position %d', tool_call.name, tool_call.start_pos)
                 self.logger.info('Arguments: %s', args)
                 output = function_to_call(**args)
                 self.logger.info('Function output: %s', output)
-                # Truncate output to first 1000 characters if longer
-                output_str = str(output).strip() if output else 'no output'
-                truncated_output = output_str[:1000] if len(output_str) > 1000 else output_str
-                formatted_output = f"<<< {truncated_output} >>>"
-                return formatted_output
+                if not output:
+                    return _wrap('no output')
+                if not isinstance(output, str):
+                    output = str(output)
+                return _wrap(output.strip())
             except Exception as e:
                 error_message = f"Error executing tool {tool_call.name}: {str(e)}"
                 self.logger.error(error_message)
-                # Truncate error message to first 1000 characters if longer
-                truncated_error = error_message[:1000] if len(error_message) > 1000 else error_message
-                return f"<<< {truncated_error} >>>"
+                return _wrap(error_message)
         error_message = f"Error: Function {tool_call.name} not found"
         self.logger.error(error_message)
-        # Truncate error message to first 1000 characters if longer
-        truncated_error = error_message[:1000] if len(error_message) > 1000 else error_message
-        return f"<<< {truncated_error} >>>"
+        return _wrap(error_message)
     
-    def process_text(self, text: str) -> Tuple[str, bool, Optional[ToolCall]]:
-        """Process tool calls in the text and append outputs directly
-        
+    def run_tool_calls(self, tool_calls: List[ToolCall]) -> List[ToolCall]:
+        """Execute a batch of detected tool calls, skipping ones already run
+
+        Args:
+            tool_calls (List[ToolCall]): Detected calls, e.g. from a
+                ToolCallScanner feed
+
+        Returns:
+            List[ToolCall]: The newly executed calls in start_pos order, with
+                outputs populated
+        """
+        new_calls = [c for c in tool_calls if c.start_pos not in self._executed_positions]
+        if not new_calls:
+            return []
+
+        new_calls.sort(key=lambda c: c.start_pos)
+        executed = self.executor.execute_all(new_calls, self.execute_tool)
+        for tool_call in executed:
+            self._executed_positions.add(tool_call.start_pos)
+            self._executed_outputs[tool_call.start_pos] = tool_call.output
+        return executed
+
+    def process_text(self, text: str) -> List[ToolCall]:
+        """Execute every unexecuted tool call found in the text
+
+        All independent calls from the buffer run concurrently through the
+        thread pool; results come back in start_pos order. Calls appearing
+        after a task-complete tag are dropped, matching the single-call
+        behaviour where generation stopped at completion.
+
         Args:
             text (str): Text to process
-            
+
         Returns:
-            Tuple[str, bool, Optional[ToolCall]]: (text with outputs appended, was_processed, executed_tool_call)
+            List[ToolCall]: Executed tool calls in order of appearance, with
+                outputs populated. Empty if no complete unexecuted call exists.
         """
         unexecuted_calls = self.find_unexecuted_tool_calls(text)
         if not unexecuted_calls:
-            return text, False, None
-            
-        # Process the first unexecuted tool call
-        tool_call = unexecuted_calls[0]
-        output = self.execute_tool(tool_call)
-        
-        # Update tool call tracking
-        tool_call.output = output
-        tool_call.executed = True
-        self.executed_tools[tool_call.id] = tool_call
-        
-        # Append output directly below tool call
-        updated_text = f"{text}\n{tool_call.name} output:\n{output}"
-        
-        return updated_text, True, tool_call
\ No newline at end of file
+            return []
+
+        # Ignore calls emitted after the model declared the task complete
+        complete_idx = text.lower().find(TASK_COMPLETE_TAG)
+        if complete_idx != -1:
+            unexecuted_calls = [c for c in unexecuted_calls if c.start_pos < complete_idx]
+            if not unexecuted_calls:
+                return []
+
+        return self.run_tool_calls(unexecuted_calls)
\ No newline at end of file
@@ -1,56 +1,121 @@
 import subprocess
+import asyncio
 import io
 import sys
 import tempfile
 import os
+import threading
+import _thread
+from contextlib import redirect_stdout, redirect_stderr
 from typing import Dict, Any
 import logging
 
 logger = logging.getLogger(__name__)
 
-def shell(command: str, timeout: int = 10) -> str:
-    """Execute a shell command and return its output with an optional timeout.
-    
+# Persistent namespace for in-process run_python calls. Imports and variables
+# carry across calls, so repeated 'import numpy' etc. only pay once.
+_sandbox_namespace: Dict[str, Any] = {}
+
+# redirect_stdout swaps the process-global sys.stdout, and the shared
+# namespace is mutated by exec — neither is safe under the tool executor's
+# worker threads. In-process executions are therefore mutually exclusive;
+# other tools can still run concurrently alongside one run_python.
+_sandbox_lock = threading.Lock()
+
+# Upper bound on captured bytes per stream for shell commands
+_SHELL_CAPTURE_LIMIT = 64 * 1024
+
+async def _drain_stream(stream: asyncio.StreamReader, chunks: list,
+                        limit: int = _SHELL_CAPTURE_LIMIT) -> None:
+    """Read a subprocess stream in fixed-size chunks into a bounded buffer.
+
+    Reading incrementally (rather than collecting everything at process exit)
+    means whatever the command printed before a timeout is still available.
+    Chunked reads rather than readline(), because a single line longer than
+    the StreamReader's internal limit makes readline() raise.
+    """
+    size = 0
+    while True:
+        chunk = await stream.read(8192)
+        if not chunk:
+            return
+        if size < limit:
+            chunks.append(chunk)
+            size += len(chunk)
+
+async def shell_async(command: str, timeout: int = 10) -> str:
+    """Execute a shell command asynchronously and return its output.
+
+    Runs the command via asyncio's subprocess support with non-blocking
+    stream reads, so output produced before a timeout is captured instead of
+    being lost in the process's pipe buffer.
+
     Args:
         command (str): The shell command to execute.
         timeout (int, optional): Maximum time in seconds to wait for command completion. Defaults to 10.
-        
+
     Returns:
         str: Command output or error message. If the command times out, returns a timeout message with captured output.
     """
     try:
-        result = subprocess.run(
+        proc = await asyncio.create_subprocess_shell(
             command,
-            shell=True,
-            text=True,
-            capture_output=True,
-            check=True,
-            timeout=timeout
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout_chunks: list = []
+        stderr_chunks: list = []
+        drains = (
+            asyncio.ensure_future(_drain_stream(proc.stdout, stdout_chunks)),
+            asyncio.ensure_future(_drain_stream(proc.stderr, stderr_chunks)),
         )
-        return result.stdout.strip()
-    except subprocess.TimeoutExpired as e:
-        # Return the output captured before timeout along with a timeout message
-        output = e.stdout.strip() if e.stdout else "No output before timeout"
-        return f"Command timed out after {timeout} seconds. Output before timeout: {output}"
-    except subprocess.CalledProcessError as e:
-        return f"Error: {e.stderr.strip()}"
+        try:
+            await asyncio.wait_for(proc.wait(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            await asyncio.gather(*drains, return_exceptions=True)
+            output = b''.join(stdout_chunks).decode(errors='replace').strip()
+            output = output if output else "No output before timeout"
+            return f"Command timed out after {timeout} seconds. Output before timeout: {output}"
+        await asyncio.gather(*drains)
+
+        if proc.returncode == 0:
+            return b''.join(stdout_chunks).decode(errors='replace').strip()
+        return f"Error: {b''.join(stderr_chunks).decode(errors='replace').strip()}"
     except Exception as e:
         return f"Error: {str(e)}"
 
-def run_python(code: str) -> str:
-    """Execute Python code from a file and return its output.
-    
-    This function saves the provided Python code to a temporary file and
-    then executes that file using the same Python interpreter that is
-    running this script. The function captures the standard output or
-    error message produced during the execution.
-    
+def shell(command: str, timeout: int = 10) -> str:
+    """Execute a shell command and return its output with an optional timeout.
+
+    Synchronous shim over shell_async running in a private event loop. Meant
+    for the tool executor's worker threads; do not call it from inside the
+    agent's own event loop thread.
+
+    Args:
+        command (str): The shell command to execute.
+        timeout (int, optional): Maximum time in seconds to wait for command completion. Defaults to 10.
+
+    Returns:
+        str: Command output or error message. If the command times out, returns a timeout message with captured output.
+    """
+    return asyncio.run(shell_async(command, timeout))
+
+def _run_python_isolated(code: str) -> str:
+    """Execute Python code in a fresh subprocess interpreter.
+
+    Saves the code to a temporary file and runs it with the interpreter that
+    is running this script. Slower than in-process execution (interpreter
+    startup plus imports on every call) but fully isolated.
+
     Args:
         code (str): The Python code to execute.
-        
+
     Returns:
         str: Captured output from stdout or an error message.
     """
+    tmp_filename = None
     try:
         # Create a temporary file to save the Python code
         with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as tmp_file:
@@ -65,9 +130,6 @@ def run_python(code: str) -> str:
             text=True
         )
 
-        # Remove the temporary file after execution
-        # os.remove(tmp_filename)
-
         # Check for errors during execution
         if result.returncode == 0:
             output = result.stdout.strip()
@@ -77,6 +139,66 @@ def run_python(code: str) -> str:
             return f"Error: {result.stderr.strip()}"
     except Exception as e:
         return f"Error: {str(e)}"
+    finally:
+        if tmp_filename:
+            try:
+                os.remove(tmp_filename)
+            except OSError:
+                pass
+
+def run_python(code: str, timeout: int = 10, isolate: bool = False) -> str:
+    """Execute Python code in-process and return its output.
+
+    The code runs via exec() in a persistent namespace shared across calls,
+    avoiding the ~50-200 ms interpreter startup of a subprocess per call and
+    letting imports carry over between invocations. Pass isolate=True to run
+    untrusted code in a fresh subprocess instead.
+
+    In-process executions are mutually exclusive (stdout redirection is
+    process-global and the namespace is shared), so concurrent run_python
+    calls from the tool executor serialize; other tools still overlap.
+
+    The timeout is only enforceable when executing on the main thread (it
+    relies on interrupting the main interpreter thread); from worker threads
+    the code runs to completion.
+
+    Args:
+        code (str): The Python code to execute.
+        timeout (int, optional): Seconds before in-process execution is
+            interrupted. Defaults to 10.
+        isolate (bool, optional): Run in a fresh subprocess instead of
+            in-process. Defaults to False.
+
+    Returns:
+        str: Captured output from stdout or an error message.
+    """
+    if isolate:
+        return _run_python_isolated(code)
+
+    stdout_capture = io.StringIO()
+    timer = None
+    if threading.current_thread() is threading.main_thread():
+        timer = threading.Timer(timeout, _thread.interrupt_main)
+        timer.start()
+    try:
+        # One in-process execution at a time: concurrent calls would
+        # cross-capture each other's stdout and race on the shared namespace
+        with _sandbox_lock:
+            with redirect_stdout(stdout_capture), redirect_stderr(stdout_capture):
+                exec(compile(code, '<agent>', 'exec'), _sandbox_namespace)
+    except KeyboardInterrupt:
+        output = stdout_capture.getvalue().strip()
+        return (f"Error: code timed out after {timeout} seconds. "
+                f"Output before timeout: {output if output else 'no output'}")
+    except Exception as e:
+        return f"Error: {str(e)}"
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    output = stdout_capture.getvalue().strip()
+    logger.debug("Python output: %s", output)
+    return output if output else "no output"
 
 # Tool specifications
 SHELL_TOOL_SPEC = {